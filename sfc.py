@@ -1,11 +1,14 @@
 import warnings
+from functools import lru_cache
 from pathlib import Path
 
 import matplotlib as plt
 import numpy as np
+import scipy.fft
+import scipy.signal
 import sounddevice as sd
 import soundfile as sf
-from scipy.signal.windows import flattop, hann, get_window
+from scipy.signal.windows import flattop, get_window
 
 
 def amplitude_spectrum(x, axis=-1):
@@ -35,7 +38,7 @@ def amplitude_spectrum(x, axis=-1):
     # move time axis to front
     x = np.moveaxis(x, axis, 0)
     n = x.shape[0]
-    X = np.fft.rfft(x, axis=0) / n
+    X = scipy.fft.rfft(x, axis=0, workers=-1) / n
     # sum complex and real part
     if n % 2 == 0:
         # zero and nyquist element only appear once in complex spectrum
@@ -76,7 +79,8 @@ def calibration_gain_from_recording(file, target_level=94, plot=False):
 
     # flattop window the recording
     window = flattop(num_samples)
-    audiodata *= window / window.mean()
+    audiodata *= window
+    audiodata /= window.mean()
 
     target_pressure = 10 ** (target_level / 20) * 20e-6 * np.sqrt(2)
     A = amplitude_spectrum(audiodata)
@@ -123,8 +127,8 @@ def exponential_sweep(T, sr, fade=0, f_start=None, f_end=None, pre_silence=0, po
     fstart, fstop : float or None
         Start and end frequency of sweep. If `None`, these correspond to
         `~0` and `sr/2.`
-    post_silence : float
-        Added zeros in seconds.
+    pre_silence, post_silence : float
+        Added zeros before and after the sweep in seconds.
 
     Returns
     -------
@@ -151,26 +155,25 @@ def exponential_sweep(T, sr, fade=0, f_start=None, f_end=None, pre_silence=0, po
     # angular frequency
     omega_start = 2 * np.pi * f_start
     omega_end = 2 * np.pi * f_end
-    # constuct sweep in time domain
-    t = np.linspace(0, T, n_tap, endpoint=False)
-    sweep = np.sin(
-        omega_start
-        * T
-        / np.log(omega_end / omega_start)
-        * (np.exp(t / T * np.log(omega_end / omega_start)) - 1)
-    )
+    # allocate output once and construct the sweep in place between silences
+    n_pre = int(round(pre_silence * sr)) if pre_silence > 0 else 0
+    n_post = int(round(post_silence * sr)) if post_silence > 0 else 0
+    out = np.zeros(n_pre + n_tap + n_post)
+    sweep = out[n_pre : n_pre + n_tap]
+    # constuct sweep in time domain, in place to avoid temporary arrays
+    L = np.log(omega_end / omega_start)
+    K = omega_start * T / L
+    sweep[:] = np.arange(n_tap)
+    sweep *= L / n_tap  # t / T * L
+    np.expm1(sweep, out=sweep)
+    sweep *= K
+    np.sin(sweep, out=sweep)
     if fade:
         n_fade = round(fade * sr)
-        fading_window = hann(2 * n_fade)
-        sweep[:n_fade] = sweep[:n_fade] * fading_window[:n_fade]
-        sweep[-n_fade:] = sweep[-n_fade:] * fading_window[-n_fade:]
-    if pre_silence > 0:
-        silence = np.zeros(int(round(pre_silence * sr)))
-        sweep = np.concatenate((silence, sweep))
-    if post_silence > 0:
-        silence = np.zeros(int(round(post_silence * sr)))
-        sweep = np.concatenate((sweep, silence))
-    return sweep
+        fading_window = _symmetric_window("hann", 2 * n_fade)
+        sweep[:n_fade] *= fading_window[:n_fade]
+        sweep[-n_fade:] *= fading_window[-n_fade:]
+    return out
 
 
 def multichannel_signal(x, n_ch, n_reps=1, add_reference=False):
@@ -196,22 +199,23 @@ def multichannel_signal(x, n_ch, n_reps=1, add_reference=False):
     """
     assert x.ndim == 1
     N = x.size
-    repsound = np.tile(x, n_reps)
-    multisound = np.zeros((n_ch * n_reps * N, n_ch))
-    for ch in range(n_ch):
-        multisound[ch * n_reps * N : (ch + 1) * n_reps * N, ch] = repsound
+    n_out = n_ch + 1 if add_reference else n_ch
+    multisound = np.zeros((n_ch, n_reps, N, n_out))
+    # write repetitions onto the block diagonal in a single indexing operation,
+    # broadcasting `x` over the repetitions instead of tiling it
+    ch = np.arange(n_ch)
+    multisound[ch, :, :, ch] = x
     if add_reference:
-        multisound = np.concatenate(
-            (multisound, multisound.sum(axis=-1)[:, None]), axis=-1
-        )
-    return multisound
+        # sum over all channels is just the repetitions played in series
+        multisound[..., -1] = x
+    return multisound.reshape(n_ch * n_reps * N, n_out)
 
 
 def regularization_fill_up_below_dynamic_range(dynamic_range_dB, x):
     """Crude choice of regularization: whenever X < max(X^2) - dynamic_range, 
     choose reg such that reg+|X|^2 == max(X^2) - dynamic_range.
     """
-    X = np.fft.rfft(x)
+    X = scipy.fft.rfft(x, workers=-1)
     # maximum of reference
     maxdB = np.max(20 * np.log10(np.abs(X)))
     # power in reference should be at least
@@ -228,15 +232,16 @@ def estimate_noise_to_signal_ratio(x, y):
     Model: y = hx + n
            n ~ N(0, noise_power)
     """
-    X = np.fft.rfft(x, axis=0)
-    Y = np.fft.rfft(y, axis=0)
+    X = scipy.fft.rfft(x, axis=0, workers=-1)
+    Y = scipy.fft.rfft(y, axis=0, workers=-1)
     noise_power = (Y.std(axis=-1)**2).reshape(Y.shape[0], -1).mean(axis=-1)
     signal_power = (np.abs(X)**2).reshape(X.shape[0], -1).mean(axis=-1)
     return noise_power / signal_power
 
 
 def transfer_function(
-    x, y, reg=np.finfo(float).eps, axis=0, return_time=True,
+    x, y, reg=np.finfo(float).eps, axis=0, return_time=True, X=None,
+    backend="numpy",
 ):
     """Compute FIR transfer-function between time domain signals.
 
@@ -253,11 +258,20 @@ def transfer_function(
         Time axis of `x` and `y` over which the DFT will be applied.
     return_time : bool, optional
         If `True`, return impulse response. Otherwise, return frequency response.
+    X : ndarray, complex, optional
+        Precomputed `scipy.fft.rfft(x, axis=axis)`. Pass this when computing
+        transfer functions of many measurements with the same reference signal
+        to avoid transforming `x` repeatedly.
+    backend : {"numpy", "cupy"}, optional
+        If "cupy", the FFTs and the deconvolution are computed on the GPU using
+        CuPy, which transforms all channels in one batched cuFFT call. Inputs
+        are copied to the GPU and the result is copied back.
 
     Notes
     -----
-    For multichannel data given as ndarrays, `np.fft.rfft(x)`, `np.fft.rfft(x)`
-    and `reg` must broadcast.
+    For multichannel data given as ndarrays, `scipy.fft.rfft(x)`,
+    `scipy.fft.rfft(y)` and `reg` must broadcast. If `x` and `y` are single
+    precision, the computation is done in single precision as well.
 
     Returns
     -------
@@ -267,19 +281,47 @@ def transfer_function(
 
     """
     n = x.shape[axis]
-    # move time axis to last dimension for easy broadcasting
-    x = np.moveaxis(x, axis, -1)
-    y = np.moveaxis(y, axis, -1)
-    # FFT
-    X = np.fft.rfft(x)
-    Y = np.fft.rfft(y)
-    # regularized deconvolution in frequency domain
-    H = Y * X.conj() / (np.abs(X) ** 2 + reg)
+    if backend == "numpy":
+        xp, fft, fft_kwargs = np, scipy.fft, {"workers": -1}
+    elif backend == "cupy":
+        import cupy as xp
+        import cupyx.scipy.fft as fft
+
+        fft_kwargs = {}
+        x, y = xp.asarray(x), xp.asarray(y)
+        if X is not None:
+            X = xp.asarray(X)
+    else:
+        raise ValueError("Invalid value for `backend`.")
+    # FFT with time axis moved to last dimension for easy broadcasting
+    if X is None:
+        X = fft.rfft(xp.moveaxis(x, axis, -1), **fft_kwargs)
+    else:
+        X = xp.moveaxis(X, axis, -1)
+    Y = fft.rfft(xp.moveaxis(y, axis, -1), **fft_kwargs)
+    # keep precision of the spectra, a float64 `reg` would promote float32
+    reg = xp.asarray(reg, dtype=X.real.dtype)
+    # regularized deconvolution in frequency domain, using
+    # |X|^2 = Re(X)^2 + Im(X)^2 to avoid a square root
+    denominator = xp.square(X.real)
+    denominator += xp.square(X.imag)
+    denominator = denominator + reg
+    if Y.shape == np.broadcast_shapes(
+        Y.shape, X.shape, denominator.shape
+    ) and Y.dtype == xp.result_type(Y, X, denominator):
+        # `Y` is a fresh spectrum of the final shape and type, reuse its buffer
+        H = Y
+        H *= X.conj()
+        H /= denominator
+    else:
+        H = Y * X.conj()
+        H = H / denominator
     # move axis back
-    H = np.moveaxis(H, -1, axis)
+    H = xp.moveaxis(H, -1, axis)
     if return_time:
-        h = np.fft.irfft(H, axis=axis, n=n)
-        return h
+        H = fft.irfft(H, n=n, axis=axis, **fft_kwargs)
+    if backend == "cupy":
+        H = xp.asnumpy(H)
     return H
 
 
@@ -383,7 +425,7 @@ def measure_via_audio_interface(x, out_chs, in_ch=1, n_reps=1, squeeze=True, **s
 
 ### recording with external front end
 
-def load_bk_wav_recording(file, n_ch=1, n_reps=1, has_reference=True):
+def load_bk_wav_recording(file, n_ch=1, n_reps=1, has_reference=True, dtype="float64"):
     """Load multichannel B&K Time Data Recording saved as WAV file.
 
     Cuts recording into chunks of equal length according to the number of
@@ -397,6 +439,9 @@ def load_bk_wav_recording(file, n_ch=1, n_reps=1, has_reference=True):
         Number of in series recorded output channels.
     n_reps : int, optional
         Number of recorded repetitions.
+    dtype : {"float64", "float32"}, optional
+        Data type of returned signals. With "float32", subsequent FFTs in this
+        module are computed in single precision, which halves memory traffic.
 
     Returns
     -------
@@ -408,13 +453,16 @@ def load_bk_wav_recording(file, n_ch=1, n_reps=1, has_reference=True):
         Samplerate.
 
     """
-    data, sr = sf.read(file)
+    data, sr = sf.read(file, dtype=dtype)
     if data.shape[0] % (n_ch * n_reps) != 0:
         # remove samples at the end if not divisable by `n_ch * n_reps`
         data = data[:- (data.shape[0] % (n_ch * n_reps))]
-    # forcing into new shape / cutting recording into sections
-    data = np.stack(np.split(np.stack(
-        np.split(data, n_ch, axis=0), axis=-1), n_reps, axis=0), axis=-1)
+    # forcing into new shape / cutting recording into sections. Sections are
+    # recorded channel by channel, each with `n_reps` repetitions, so this is
+    # just a reshape and moving the section axes to the end (a view, no copy).
+    # Mono recordings have no input axis.
+    data = data.reshape(n_ch, n_reps, -1, *data.shape[1:])
+    data = np.moveaxis(data, (0, 1), (-2, -1))
     if has_reference:
         return data[:, :1], data[:, 1:], sr
     return data, sr
@@ -425,18 +473,20 @@ def bk_planar_array_mic_positions():
 
     Returns
     -------
-    r : np.ndarray(shape=[60, 2])
+    r : np.ndarray(shape=[2, 60])
 
     """
     x = np.linspace(0, 0.675, 10)
     y = np.linspace(0.375, 0, 6)
-    X, Y = np.meshgrid(x, y, indexing="ij")
-    r = np.array((X.flatten(), Y.flatten()))
+    # same ordering as flattening an "ij"-indexed meshgrid
+    r = np.empty((2, x.size * y.size))
+    r[0] = np.repeat(x, y.size)
+    r[1] = np.tile(y, x.size)
     return r
 
 ### Filter computation
 
-def pressure_matching(H, h_target, reg=np.finfo(float).eps):
+def pressure_matching(H, h_target, reg=np.finfo(float).eps, method="lstsq"):
     """Compute loudspeaker weights via pressure matching with l2 regularization.
 
     Solves the following least-square problem indepedently for each frequency:
@@ -449,6 +499,12 @@ def pressure_matching(H, h_target, reg=np.finfo(float).eps):
     h_target : np.ndarray[shape=(nf, nm), dtype=complex]
     reg : float or np.ndarray[shape=(nf,)]
         Regularization Parameter
+    method : {"lstsq", "normal"}, optional
+        If "lstsq" (default), solve the equivalent least-squares problem
+        frequency by frequency. If "normal", solve the regularized normal
+        equations of all frequencies in a single batched call. This is faster,
+        but squares the condition number of `H` and fails if
+        `H^H H + reg * I` is singular, e.g. for `nm < ns` and small `reg`.
 
     Returns
     -------
@@ -456,21 +512,36 @@ def pressure_matching(H, h_target, reg=np.finfo(float).eps):
         Complex weights
 
     """
-    nf, _, ns = H.shape
+    nf, nm, ns = H.shape
 
     reg = np.broadcast_to(reg, (nf,))
 
-    w = np.zeros((nf, ns), dtype=complex)
-    for i in range(nf):
-        # Solve equivalent least-squares problem
-        #
-        # min_w ||[[H            ],         [[h_target], ||^2
-        #       ||[sqrt(reg) * I]]  *  w -  [0       ]]  ||
-        #
-        # NOTE: one could also use sklearn.linear_model.Ridge
-        A = np.concatenate((H[i], np.sqrt(reg[i]) * np.identity(ns)), axis=0)
-        b = np.concatenate((h_target[i], np.zeros(ns)), axis=0)
-        w[i] = np.linalg.lstsq(A, b, rcond=None)[0]
+    if method == "normal":
+        # Solve (H^H H + reg * I) w = H^H h_target for all frequencies at once
+        Hh = np.conj(H).swapaxes(-1, -2)
+        A = Hh @ H + reg[:, None, None] * np.identity(ns)
+        b = Hh @ h_target[..., None]
+        w = np.linalg.solve(A, b)[..., 0]
+    elif method == "lstsq":
+        w = np.zeros((nf, ns), dtype=complex)
+        # augmented system, allocated once and filled for each frequency
+        identity = np.identity(ns)
+        A = np.zeros((nm + ns, ns), dtype=complex)
+        b = np.zeros(nm + ns, dtype=complex)
+        sqrt_reg = np.sqrt(reg)
+        for i in range(nf):
+            # Solve equivalent least-squares problem
+            #
+            # min_w ||[[H            ],         [[h_target], ||^2
+            #       ||[sqrt(reg) * I]]  *  w -  [0       ]]  ||
+            #
+            # NOTE: one could also use sklearn.linear_model.Ridge
+            A[:nm] = H[i]
+            np.multiply(identity, sqrt_reg[i], out=A[nm:])
+            b[:nm] = h_target[i]
+            w[i] = np.linalg.lstsq(A, b, rcond=None)[0]
+    else:
+        raise ValueError("Invalid value for `method`.")
 
     return w
 
@@ -490,20 +561,32 @@ def _check_audio_flags():
         warnings.warn("Primed output")
 
 
+@lru_cache(maxsize=32)
+def _symmetric_window(window, n):
+    """Cached symmetric window from `scipy.signal.get_window`.
+
+    Meant for short fade windows. The returned array is shared between calls
+    and therefore read-only.
+    """
+    w = get_window(window, n, fftbins=False)
+    w.setflags(write=False)
+    return w
+
+
 def _sample_window(n, startwindow, stopwindow, window):
     """Create a sample domain window."""
     swindow = np.ones(n)
 
     if startwindow is not None:
         length = startwindow[1] - startwindow[0]
-        w = get_window(window, 2 * length, fftbins=False)[:length]
+        w = _symmetric_window(window, 2 * length)[:length]
         swindow[: startwindow[0]] = 0
         swindow[startwindow[0] : startwindow[1]] = w
 
     if stopwindow is not None:
         # stop window
         length = stopwindow[1] - stopwindow[0]
-        w = get_window(window, 2 * length, fftbins=False)[length:]
+        w = _symmetric_window(window, 2 * length)[length:]
         swindow[stopwindow[0] + 1 : stopwindow[1] + 1] = w
         swindow[stopwindow[1] + 1 :] = 0
 
@@ -604,19 +687,22 @@ def time_window_around_peak(ir, sr, tleft, tright, window='tukey', param=0.5):
     # convert time to samples
     samples_left = int(sr * tleft)
     samples_right = int(sr * tright)
-    # construct window
-    windows = np.ones(ir.shape)
-    for i in range(ir.shape[1]):
-        idx_peak = np.argmax(np.abs(ir[:, i]))
-        idx_window_start = max(idx_peak - samples_left, 0)
-        idx_window_end = min(idx_peak + samples_right, ir.shape[0])
-        if param is not None:
-            w = get_window((window, param), idx_window_end - idx_window_start)
-        else:
-            w = get_window(window, idx_window_end - idx_window_start)
-        windows[idx_window_start:idx_window_end, i] *= w
-        windows[:idx_window_start, i] = 0
-        windows[idx_window_end:, i] = 0
+    # window boundaries of all channels
+    idx_peak = np.argmax(np.abs(ir), axis=0)
+    idx_window_start = np.maximum(idx_peak - samples_left, 0)
+    idx_window_end = np.minimum(idx_peak + samples_right, ir.shape[0])
+    # construct window, only once per window length as they differ only when
+    # clipped at the start or end of the response
+    windows = np.zeros(ir.shape)
+    cached_windows = {}
+    for i, (start, end) in enumerate(zip(idx_window_start, idx_window_end)):
+        length = int(end - start)
+        if length not in cached_windows:
+            if param is not None:
+                cached_windows[length] = get_window((window, param), length)
+            else:
+                cached_windows[length] = get_window(window, length)
+        windows[start:end, i] = cached_windows[length]
     return windows.reshape(orig_shape)
 
 
@@ -670,19 +756,27 @@ def frequency_vector(n, sr, sided="single"):
 
 
 def _find_nearest(array, value):
-    """Find nearest value in an array and its index."""
-    idx = (np.abs(array - value)).argmin()
+    """Find nearest value in an ascending array and its index."""
+    idx = np.searchsorted(array, value)
+    if idx == len(array) or (idx > 0 and value - array[idx - 1] <= array[idx] - value):
+        idx -= 1
     return array[idx], idx
 
 
+# filters up to this length are applied by direct convolution in `olafilt`
+_DIRECT_CONVOLUTION_MAX_TAPS = 64
+
+
 def olafilt(b, x, subscripts=None, zi=None):
     """Filter a multi dimensional array with an FIR filter matrix.
 
     Filter a data sequence, `x`, using a FIR filter given in `b`. Filtering uses
     the overlap-add method converting both `x` and `b` into frequency domain
-    first.  The FFT size is determined as the next higher power of 2 of twice
-    the length of `b`. Multi-channel fitering is support via `numpy.einsum`
-    notation.
+    first. Single-channel filtering is done by `scipy.signal.oaconvolve`, or by
+    direct convolution for very short filters.
+    Multi-channel fitering is support via `numpy.einsum` notation. In this
+    case, the FFT size is determined as the next higher power of 2 of twice
+    the length of `b`.
 
     Parameters
     ----------
@@ -725,39 +819,45 @@ def olafilt(b, x, subscripts=None, zi=None):
     L_I = b.shape[0]
     L_sig = x.shape[0]
 
-    # find power of 2 larger that 2*L_I (from abarnert on Stackoverflow)
-    L_F = int(2 << (L_I - 1).bit_length())  # FFT Size
-    L_S = L_F - L_I + 1  # length of segments
-    offsets = range(0, L_sig, L_S)
-
-    if subscripts is None:
-        outshape = L_sig + L_F
+    if subscripts is None and L_sig == 0:
+        # nothing to filter, output is just the initial state
+        res = np.zeros(L_I - 1, dtype=np.result_type(b, x, np.float32))
+    elif subscripts is None and L_I <= _DIRECT_CONVOLUTION_MAX_TAPS:
+        # short 1D filter, direct convolution is faster than FFTs. Cast to
+        # the same floating point type the FFT based paths return.
+        dtype = np.result_type(b, x, np.float32)
+        res = np.convolve(x.astype(dtype, copy=False), b.astype(dtype, copy=False))
+    elif subscripts is None:
+        # fast 1D case
+        res = scipy.signal.oaconvolve(x, b)
     else:
-        outshape = (L_sig + L_F, *_einsum_outshape(subscripts, b, x)[1:])
-
-    # handle complex or real input
-    if np.iscomplexobj(b) or np.iscomplexobj(x):
-        fft_func = np.fft.fft
-        ifft_func = np.fft.ifft
-        res = np.zeros(outshape, dtype=np.complex128)
-    else:
-        fft_func = np.fft.rfft
-        ifft_func = np.fft.irfft
-        res = np.zeros(outshape)
-
-    B = fft_func(b, n=L_F, axis=0)
+        # find power of 2 larger that 2*L_I (from abarnert on Stackoverflow)
+        L_F = int(2 << (L_I - 1).bit_length())  # FFT Size
+        L_S = L_F - L_I + 1  # length of segments
+
+        # handle complex or real input, keeping single precision if both `b`
+        # and `x` are single precision
+        if np.iscomplexobj(b) or np.iscomplexobj(x):
+            fft_func = scipy.fft.fft
+            ifft_func = scipy.fft.ifft
+            dtype = np.result_type(b, x, np.complex64)
+        else:
+            fft_func = scipy.fft.rfft
+            ifft_func = scipy.fft.irfft
+            dtype = np.result_type(b, x, np.float32)
 
-    # overlap and add
-    for n in offsets:
-        Xseg = fft_func(x[n : n + L_S], n=L_F, axis=0)
+        B = fft_func(b.astype(dtype, copy=False), n=L_F, axis=0)
 
-        if subscripts is None:
-            # fast 1D case
-            C = B * Xseg
-        else:
-            C = np.einsum(subscripts, B, Xseg)
+        outshape = (L_sig + L_F, *_einsum_outshape(subscripts, b, x)[1:])
+        res = np.zeros(outshape, dtype=dtype)
 
-        res[n : n + L_F] += ifft_func(C, axis=0)
+        # overlap and add, with multithreaded FFTs for each segment
+        with scipy.fft.set_workers(-1):
+            for n in range(0, L_sig, L_S):
+                Xseg = fft_func(x[n : n + L_S], n=L_F, axis=0)
+                C = np.einsum(subscripts, B, Xseg)
+                # `C` is a temporary, so let the inverse FFT work in its buffer
+                res[n : n + L_F] += ifft_func(C, n=L_F, axis=0, overwrite_x=True)
 
     if zi is not None:
         res[: L_I - 1] = res[: L_I - 1] + zi
@@ -786,4 +886,4 @@ def _einsum_outshape(subscripts, *operants):
             outshape.append(innumber[indices].max())
         except ValueError:
             raise ValueError(f"Invalid subscripts: {subscripts}")
-    return tuple(outshape)
\ No newline at end of file
+    return tuple(outshape)
@@ -0,0 +1,97 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+import sfc
+
+
+def test_pressure_matching_underdetermined_default_reg():
+    # fewer microphones than loudspeakers and tiny regularization make the
+    # normal equations (near) singular, the default must still solve it
+    rng = np.random.default_rng(0)
+    nf, nm, ns = 50, 4, 10
+    H = rng.standard_normal((nf, nm, ns)) + 1j * rng.standard_normal((nf, nm, ns))
+    h_target = rng.standard_normal((nf, nm)) + 1j * rng.standard_normal((nf, nm))
+
+    w = sfc.pressure_matching(H, h_target)
+
+    for i in range(nf):
+        w_min_norm = np.linalg.lstsq(H[i], h_target[i], rcond=None)[0]
+        np.testing.assert_allclose(w[i], w_min_norm, atol=1e-6)
+
+
+def test_pressure_matching_identical_loudspeakers():
+    rng = np.random.default_rng(0)
+    nf, nm = 10, 6
+    H = rng.standard_normal((nf, nm, 1)) + 1j * rng.standard_normal((nf, nm, 1))
+    H = np.repeat(H, 3, axis=-1)
+    h_target = rng.standard_normal((nf, nm)) + 1j * rng.standard_normal((nf, nm))
+
+    # with enough regularization the solution distributes the weight evenly
+    w = sfc.pressure_matching(H, h_target, reg=1e-6)
+
+    np.testing.assert_allclose(w[:, 0], w[:, 1], atol=1e-6)
+    np.testing.assert_allclose(w[:, 0], w[:, 2], atol=1e-6)
+
+
+def test_pressure_matching_normal_equals_lstsq():
+    rng = np.random.default_rng(0)
+    nf, nm, ns = 20, 10, 4
+    H = rng.standard_normal((nf, nm, ns)) + 1j * rng.standard_normal((nf, nm, ns))
+    h_target = rng.standard_normal((nf, nm)) + 1j * rng.standard_normal((nf, nm))
+    reg = rng.uniform(1e-3, 1e-1, nf)
+
+    w_normal = sfc.pressure_matching(H, h_target, reg=reg, method="normal")
+    w_lstsq = sfc.pressure_matching(H, h_target, reg=reg, method="lstsq")
+
+    np.testing.assert_allclose(w_normal, w_lstsq, rtol=1e-10, atol=1e-12)
+
+
+def test_pressure_matching_invalid_method():
+    H = np.ones((2, 3, 2), dtype=complex)
+    h_target = np.ones((2, 3), dtype=complex)
+    with pytest.raises(ValueError):
+        sfc.pressure_matching(H, h_target, method="foo")
+
+
+def test_transfer_function_single_precision():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(256).astype(np.float32)
+    y = np.stack((x, 0.5 * x), axis=-1)
+
+    h = sfc.transfer_function(x[:, None], y)
+    H = sfc.transfer_function(x[:, None], y, return_time=False)
+
+    assert h.dtype == np.float32
+    assert H.dtype == np.complex64
+
+
+def test_load_bk_wav_recording_single_precision(tmp_path):
+    rng = np.random.default_rng(0)
+    n_ch, n_reps, n_samp, n_in = 2, 3, 64, 2
+    data = rng.uniform(-0.5, 0.5, (n_ch * n_reps * n_samp, 1 + n_in))
+    file = tmp_path / "recording.wav"
+    sf.write(file, data, 48000, "FLOAT")
+
+    x, y, sr = sfc.load_bk_wav_recording(file, n_ch, n_reps, dtype="float32")
+    h = sfc.transfer_function(x, y)
+
+    assert x.shape == (n_samp, 1, n_ch, n_reps)
+    assert y.shape == (n_samp, n_in, n_ch, n_reps)
+    assert x.dtype == y.dtype == h.dtype == np.float32
+
+
+def test_load_bk_wav_recording_mono(tmp_path):
+    n_ch, n_reps, n_samp = 2, 3, 20
+    data = np.arange(n_ch * n_reps * n_samp) / 1000
+    file = tmp_path / "recording.wav"
+    sf.write(file, data, 48000, "FLOAT")
+
+    y, sr = sfc.load_bk_wav_recording(file, n_ch, n_reps, has_reference=False)
+
+    assert y.shape == (n_samp, n_ch, n_reps)
+    # sections are recorded channel by channel, repetitions within channels
+    np.testing.assert_allclose(
+        y[:, 1, 2], data[(1 * n_reps + 2) * n_samp : (1 * n_reps + 3) * n_samp],
+        rtol=1e-6,
+    )